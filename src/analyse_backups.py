@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import backup_analytics
+import backup_store
+import argparse
+import hjson
+import json
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", dest='config_file', action='store', required=False, help="The HJSON configuration file used to build the backup module")
+    parser.add_argument("--location", dest='location', action='store', required=False, help="s3://bucket/prefix or local directory holding the backup data. Defaults to the configured Firehose destination")
+    parser.add_argument("--sample-objects", dest='sample_objects', action='store', type=int, default=20, help="Number of objects per table to read for record statistics")
+    parser.add_argument("--prices", dest='prices', action='store', required=False, help="HJSON file of unit prices to override the defaults with")
+    parser.add_argument("--no-catalog", dest='no_catalog', action='store_true', required=False, help="List and sample all backup objects rather than using the backup catalog")
+    parser.add_argument("--json", dest='json', action='store_true', required=False, help="Output the results as JSON")
+    parser.add_argument('tables', nargs='*', help='Tables to analyse. Defaults to all tables found in the backup location')
+    args = parser.parse_args()
+
+    config = None
+    if args.config_file != None:
+        config = hjson.load(open(args.config_file, 'r'))
+
+    if args.location != None:
+        location = args.location
+    elif config != None:
+        location = backup_store.location_from_config(config)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    prices = dict(backup_analytics.DEFAULT_PRICES)
+    if args.prices != None:
+        prices.update(hjson.load(open(args.prices, 'r')))
+
+    tables = args.tables
+    if len(tables) == 0:
+        tables = backup_store.list_tables(location)
+
+    results = []
+    for x in tables:
+        stats = backup_analytics.analyse_table(location, x, config, args.sample_objects, use_catalog=not args.no_catalog)
+        projection = backup_analytics.project_monthly_cost(stats, config, prices)
+
+        if args.json:
+            results.append({"statistics": stats, "projectedMonthlyCost": projection})
+        else:
+            backup_analytics.print_report(stats, projection)
+
+    if args.json:
+        print json.dumps(results, indent=2)
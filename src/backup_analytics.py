@@ -0,0 +1,270 @@
+'''
+Module which analyses the backup data that has actually been delivered for each table, and projects the monthly cost
+of continuous backup from it.
+
+Only object listings and sizes are used for the bulk of the analysis, with a small sample of objects read to establish
+record sizes and the compression ratio achieved by Kinesis Firehose. Where the table has a backup catalog, its exact
+record counts and sizes are used instead, and only objects delivered since the catalog was updated are listed and
+sampled. This works against both Amazon S3 and a local copy of the bucket layout
+'''
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import math
+import random
+import backup_catalog
+import backup_store
+
+HOURS_PER_MONTH = 730
+GB = 1024.0 * 1024.0 * 1024.0
+
+# list prices in USD used for projection, before any free tier - override with the --prices option where they differ
+DEFAULT_PRICES = {
+    # Kinesis Firehose ingestion, which is billed per record rounded up to the nearest 5KB
+    "firehoseIngestPerGB": 0.035,
+    "firehoseRecordRoundingKB": 5,
+    # S3 storage of a month of backup data, and the PUT requests Firehose makes to deliver it
+    "s3StoragePerGBMonth": 0.03,
+    "s3PutPer1000": 0.005,
+    # AWS Lambda invocations of LambdaStreamsToFirehose. Update Stream reads made by Lambda triggers are not charged
+    "lambdaInvocationsPerMillion": 0.20
+}
+
+# settings used when they are not present in the supplied configuration
+DEFAULT_SETTINGS = {
+    "firehoseDeliverySizeMB": 128,
+    "firehoseDeliveryIntervalSeconds": 60,
+    "streamsMaxRecordsBatch": 1000
+}
+
+# tables are flagged when their objects are on average smaller than this, once they have enough objects to judge
+SMALL_OBJECT_BYTES = 1024 * 1024
+MIN_OBJECTS_TO_FLAG = 24
+MAX_FIREHOSE_INTERVAL_SECONDS = 900
+# delivery is taken to be bound by the buffering interval once a table writes at least this fraction of an object per interval
+INTERVAL_BOUND_FRACTION = 0.75
+# a batch of Update Stream records must be smaller than this, as described for streamsMaxRecordsBatch in the README
+MAX_BATCH_BYTES = 128 * 1024
+
+
+def _setting(config, key):
+    if config != None and key in config:
+        return config[key]
+    else:
+        return DEFAULT_SETTINGS[key]
+
+
+'''
+Scan the delivered backup data for a table, reading at most sample_size uncatalogued objects, and return a dict of
+volume statistics
+'''
+def analyse_table(location, table_name, config=None, sample_size=20, seed=None, use_catalog=True):
+    interval = _setting(config, 'firehoseDeliveryIntervalSeconds')
+    rng = random.Random(seed)
+
+    object_count = 0
+    total_bytes = 0
+    first_time = None
+    last_time = None
+    sample = []
+    catalogued = {"objects": 0, "records": 0, "bytes": 0, "uncompressedBytes": 0}
+    uncatalogued_count = 0
+
+    # single pass over the objects, keeping a uniform reservoir sample of uncatalogued objects to read
+    for x in backup_catalog.table_objects(location, table_name, use_catalog=use_catalog):
+        object_count += 1
+        total_bytes += x['Size']
+
+        if "Records" in x:
+            object_time = x['StartTime']
+        else:
+            object_time = backup_store.key_timestamp(x['Key'])
+            if object_time == None:
+                object_time = x['LastModified']
+
+        if first_time == None or object_time < first_time:
+            first_time = object_time
+        if last_time == None or object_time > last_time:
+            last_time = object_time
+
+        if "Records" in x:
+            # catalog entries already hold exact record statistics
+            catalogued["objects"] += 1
+            catalogued["records"] += x['Records']
+            catalogued["bytes"] += x['Size']
+            catalogued["uncompressedBytes"] += x['UncompressedSize']
+            continue
+
+        uncatalogued_count += 1
+        if len(sample) < sample_size:
+            sample.append(x)
+        else:
+            slot = rng.randint(0, uncatalogued_count - 1)
+            if slot < sample_size:
+                sample[slot] = x
+
+    stats = {
+        "table": table_name,
+        "objects": object_count,
+        "bytes": total_bytes,
+        "firstObjectTime": first_time,
+        "lastObjectTime": last_time,
+        "cataloguedObjects": catalogued["objects"],
+        "sampledObjects": catalogued["objects"],
+        "sampledRecords": catalogued["records"],
+        "sampledBytes": catalogued["bytes"],
+        "sampledUncompressedBytes": catalogued["uncompressedBytes"],
+        "flags": []
+    }
+
+    if object_count == 0:
+        return stats
+
+    # the last object covers up to one buffering interval after it was started
+    span_hours = max(last_time - first_time + interval, interval) / 3600.0
+
+    for x in sample:
+        data = backup_store.read_object(location, x['Key'])
+        records = 0
+        for record in backup_store.parse_records(data):
+            records += 1
+
+        stats["sampledObjects"] += 1
+        stats["sampledRecords"] += records
+        stats["sampledBytes"] += x['Size']
+        stats["sampledUncompressedBytes"] += len(data)
+
+    stats["spanHours"] = span_hours
+    stats["objectsPerHour"] = object_count / span_hours
+    stats["bytesPerHour"] = total_bytes / span_hours
+    stats["averageObjectBytes"] = total_bytes / float(object_count)
+
+    if stats["sampledBytes"] > 0 and stats["sampledRecords"] > 0:
+        estimated_records = int(round(total_bytes * stats["sampledRecords"] / float(stats["sampledBytes"])))
+
+        stats["compressionRatio"] = stats["sampledUncompressedBytes"] / float(stats["sampledBytes"])
+        stats["averageRecordBytes"] = stats["sampledUncompressedBytes"] / float(stats["sampledRecords"])
+        stats["estimatedRecords"] = estimated_records
+        stats["changesPerHour"] = estimated_records / span_hours
+    else:
+        stats["compressionRatio"] = None
+        stats["averageRecordBytes"] = None
+        stats["estimatedRecords"] = 0
+        stats["changesPerHour"] = 0.0
+
+    stats["flags"] = flag_small_objects(stats, config) + flag_batch_settings(stats, config)
+
+    return stats
+
+
+'''
+Determine whether the Firehose buffering settings in the configuration cause a table to produce an excessive number of
+small objects, returning a list of human readable findings
+'''
+def flag_small_objects(stats, config=None):
+    flags = []
+
+    if stats["objects"] < MIN_OBJECTS_TO_FLAG:
+        return flags
+
+    interval = _setting(config, 'firehoseDeliveryIntervalSeconds')
+    size_mb = _setting(config, 'firehoseDeliverySizeMB')
+    interval_objects_per_hour = 3600.0 / interval
+
+    # quiet tables write small objects whatever the interval, so only tables delivering on about every interval are flagged
+    interval_bound = INTERVAL_BOUND_FRACTION * interval_objects_per_hour <= stats["objectsPerHour"] <= 1.5 * interval_objects_per_hour
+
+    if stats["averageObjectBytes"] < SMALL_OBJECT_BYTES and interval_bound:
+        finding = "Average object size is %.1f KB, with %.1f objects per hour" % (stats["averageObjectBytes"] / 1024.0, stats["objectsPerHour"])
+        if interval < MAX_FIREHOSE_INTERVAL_SECONDS:
+            finding += ". Delivery is bound by firehoseDeliveryIntervalSeconds=%s - raise it (up to %s) to write fewer, larger objects" % (interval, MAX_FIREHOSE_INTERVAL_SECONDS)
+        flags.append(finding)
+
+    if stats["objectsPerHour"] > 1.5 * interval_objects_per_hour:
+        flags.append("%.1f objects per hour exceeds the %.1f expected from the buffering interval. Delivery is bound by firehoseDeliverySizeMB=%s - raise it to write fewer, larger objects" % (stats["objectsPerHour"], interval_objects_per_hour, size_mb))
+
+    return flags
+
+
+'''
+Determine whether streamsMaxRecordsBatch is too large for the observed record size, returning a list of human readable
+findings. The batch size does not change the number of objects Firehose writes, so this is reported separately
+'''
+def flag_batch_settings(stats, config=None):
+    flags = []
+
+    batch = _setting(config, 'streamsMaxRecordsBatch')
+
+    if stats["averageRecordBytes"] != None and stats["averageRecordBytes"] * batch > MAX_BATCH_BYTES:
+        flags.append("streamsMaxRecordsBatch=%s with an average record of %.1f bytes gives %.1f KB batches, over the %s KB limit - reduce it to at most %s" % (batch, stats["averageRecordBytes"], stats["averageRecordBytes"] * batch / 1024.0, MAX_BATCH_BYTES / 1024, int(MAX_BATCH_BYTES / stats["averageRecordBytes"])))
+
+    return flags
+
+
+'''
+Project the monthly cost of continuous backup for a table from its volume statistics
+'''
+def project_monthly_cost(stats, config=None, prices=None):
+    if prices == None:
+        prices = DEFAULT_PRICES
+
+    projection = {
+        "firehose": 0.0,
+        "s3Storage": 0.0,
+        "s3Requests": 0.0,
+        "lambdaMinimum": 0.0,
+        "total": 0.0
+    }
+
+    if stats["objects"] == 0:
+        return projection
+
+    records_per_month = stats["changesPerHour"] * HOURS_PER_MONTH
+
+    # Firehose bills every record as if it were a whole number of 5KB units
+    if stats["averageRecordBytes"] != None:
+        rounding = prices["firehoseRecordRoundingKB"] * 1024.0
+        billed_record_bytes = math.ceil(stats["averageRecordBytes"] / rounding) * rounding
+        projection["firehose"] = records_per_month * billed_record_bytes / GB * prices["firehoseIngestPerGB"]
+
+    projection["s3Storage"] = stats["bytesPerHour"] * HOURS_PER_MONTH / GB * prices["s3StoragePerGBMonth"]
+    projection["s3Requests"] = stats["objectsPerHour"] * HOURS_PER_MONTH / 1000.0 * prices["s3PutPer1000"]
+
+    # the actual batch sizes are not recorded in the backup data, so this assumes every invocation carries a full batch
+    # and excludes duration charges, giving the lowest Lambda cost the change rate allows
+    invocations = records_per_month / _setting(config, 'streamsMaxRecordsBatch')
+    projection["lambdaMinimum"] = invocations / 1000000.0 * prices["lambdaInvocationsPerMillion"]
+
+    projection["total"] = sum([projection[x] for x in projection if x != "total"])
+
+    return projection
+
+
+'''
+Print a report of the volume statistics and cost projection for a table
+'''
+def print_report(stats, projection):
+    print "Table %s" % (stats["table"])
+
+    if stats["objects"] == 0:
+        print "  No backup data found"
+        return
+
+    print "  Objects:              %s (%.1f per hour, %.1f KB average)" % (stats["objects"], stats["objectsPerHour"], stats["averageObjectBytes"] / 1024.0)
+    print "  Stored Bytes:         %s (%.1f MB per hour)" % (stats["bytes"], stats["bytesPerHour"] / (1024.0 * 1024.0))
+    print "  Sampled:              %s objects (%s from the catalog), %s records" % (stats["sampledObjects"], stats["cataloguedObjects"], stats["sampledRecords"])
+
+    if stats["averageRecordBytes"] != None:
+        print "  Average Record Bytes: %.1f" % (stats["averageRecordBytes"])
+        print "  Compression Ratio:    %.2f" % (stats["compressionRatio"])
+    print "  Estimated Changes:    %s (%.1f per hour)" % (stats["estimatedRecords"], stats["changesPerHour"])
+
+    print "  Projected Monthly Cost (USD), with Lambda invocations at their minimum and excluding Lambda duration:"
+    for x in ["firehose", "s3Storage", "s3Requests", "lambdaMinimum", "total"]:
+        print "    %-14s %10.2f" % (x, projection[x])
+
+    for x in stats["flags"]:
+        print "  WARNING: %s" % (x)
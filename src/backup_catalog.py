@@ -0,0 +1,325 @@
+'''
+Module which maintains a catalog of the backup objects delivered for each table, so that readers of the backup data can
+find the objects covering a time window without listing the whole table prefix.
+
+The catalog for a table is kept below '_catalog/<table>/' in the backup location. It is an append-only set of GZIP
+compressed JSON line segments, each holding an entry per backup object with its key, size, record count, minimum and
+maximum SequenceNumber and approximate event time range. Every segment holds the objects of a single UTC day of event
+time, and once a day has too many segments they are compacted into one. An index object names the segments together
+with their event time and SequenceNumber ranges, so that a query only reads the segments which overlap its window.
+
+The index also holds a watermark of the latest Firehose hour folder catalogued and the keys catalogued in the lookback
+window before it. Firehose can deliver objects late into earlier hour folders, so each update lists from the start of
+the lookback window and skips the keys already known, reading no segments. Objects delivered later than the lookback
+window are only found by a full rebuild. Only one catalog update should run per table at a time
+'''
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import gzip
+import io
+import json
+import time
+import backup_store
+
+INDEX_NAME = 'index.json'
+SEGMENT_NAME = 'manifest-%08d.jsonl.gz'
+DEFAULT_LOOKBACK_HOURS = 24
+# once a day has more than this many segments, they are rewritten as a single segment
+MAX_DAY_SEGMENTS = 24
+
+
+def _catalog_key(table_name, name):
+    return "%s/%s/%s" % (backup_store.CATALOG_DIRECTORY, table_name, name)
+
+
+def _hour_start(key):
+    key_time = backup_store.key_timestamp(key)
+
+    if key_time == None:
+        return None
+    else:
+        return key_time - key_time % 3600
+
+
+def _day(event_time):
+    return time.strftime('%Y-%m-%d', time.gmtime(event_time))
+
+
+def _overlaps(start_time, end_time, start, end):
+    return (start == None or end_time >= start) and (end == None or start_time <= end)
+
+
+'''
+Load the catalog index for a table, or return None if the table has no catalog
+'''
+def load_index(location, table_name):
+    key = _catalog_key(table_name, INDEX_NAME)
+
+    if not backup_store.object_exists(location, key):
+        return None
+    else:
+        return json.loads(backup_store.read_object(location, key).decode('utf-8'))
+
+
+def _write_index(location, table_name, index):
+    backup_store.write_object(location, _catalog_key(table_name, INDEX_NAME), json.dumps(index, indent=2, sort_keys=True).encode('utf-8'))
+
+
+def _read_segment(location, table_name, segment):
+    return list(backup_store.read_records(location, _catalog_key(table_name, segment["Name"])))
+
+
+'''
+Write a segment of catalog entries, returning its summary for the index
+'''
+def _write_segment(location, table_name, index, day, entries):
+    entries = sorted(entries, key=lambda x: x["Key"])
+    name = SEGMENT_NAME % (index["nextSegment"])
+    index["nextSegment"] += 1
+
+    buffer = io.BytesIO()
+    f = gzip.GzipFile(fileobj=buffer, mode='wb')
+    for x in entries:
+        f.write((json.dumps(x, sort_keys=True) + "\n").encode('utf-8'))
+    f.close()
+
+    backup_store.write_object(location, _catalog_key(table_name, name), buffer.getvalue())
+
+    sequence_numbers = [int(x[y]) for x in entries for y in ["MinSequenceNumber", "MaxSequenceNumber"] if x[y] != None]
+
+    return {
+        "Name": name,
+        "Day": day,
+        "Objects": len(entries),
+        "StartTime": min([x["StartTime"] for x in entries]),
+        "EndTime": max([x["EndTime"] for x in entries]),
+        "MinSequenceNumber": str(min(sequence_numbers)) if len(sequence_numbers) > 0 else None,
+        "MaxSequenceNumber": str(max(sequence_numbers)) if len(sequence_numbers) > 0 else None
+    }
+
+
+'''
+Load the entries in the catalog for a table which may hold events between start and end (seconds since the epoch,
+either of which may be None), reading only the segments whose event time range overlaps the window. Returns None if the
+table has no catalog
+'''
+def load_catalog(location, table_name, start=None, end=None, index=None):
+    if index == None:
+        index = load_index(location, table_name)
+
+    if index == None:
+        return None
+
+    entries = []
+    for x in index['segments']:
+        if _overlaps(x["StartTime"], x["EndTime"], start, end):
+            entries.extend(_read_segment(location, table_name, x))
+
+    return query_catalog(entries, start, end)
+
+
+'''
+Build the catalog entry for a backup object listing, reading the object to find its records. The event time range is
+taken from the record ApproximateCreationDateTime values where present, and otherwise spans from the time Firehose
+started the object to the time it was delivered
+'''
+def catalog_entry(location, listing):
+    data = backup_store.read_object(location, listing['Key'])
+
+    records = 0
+    min_sequence_number = None
+    max_sequence_number = None
+    min_event_time = None
+    max_event_time = None
+
+    for record in backup_store.parse_records(data):
+        records += 1
+
+        if "SequenceNumber" in record:
+            sequence_number = int(record["SequenceNumber"])
+            if min_sequence_number == None or sequence_number < min_sequence_number:
+                min_sequence_number = sequence_number
+            if max_sequence_number == None or sequence_number > max_sequence_number:
+                max_sequence_number = sequence_number
+
+        event_time = backup_store.record_event_time(record)
+        if event_time != None:
+            if min_event_time == None or event_time < min_event_time:
+                min_event_time = event_time
+            if max_event_time == None or event_time > max_event_time:
+                max_event_time = event_time
+
+    if min_event_time == None:
+        min_event_time = backup_store.key_timestamp(listing['Key'])
+        if min_event_time == None:
+            min_event_time = listing['LastModified']
+        max_event_time = max(min_event_time, listing['LastModified'])
+
+    return {
+        "Key": listing['Key'],
+        "Size": listing['Size'],
+        "UncompressedSize": len(data),
+        "Records": records,
+        # sequence numbers exceed the range of some JSON readers, so are kept as strings as in the backup data
+        "MinSequenceNumber": str(min_sequence_number) if min_sequence_number != None else None,
+        "MaxSequenceNumber": str(max_sequence_number) if max_sequence_number != None else None,
+        "StartTime": min_event_time,
+        "EndTime": max_event_time
+    }
+
+
+'''
+Generate the listings of backup objects which are not in the catalog. With an index, only the hour folders from the start
+of the lookback window before the watermark are listed, skipping the keys the index already knows about. Without one,
+the whole table prefix is listed, skipping any known_keys supplied. Listing stops at the first hour folder after the
+optional end time, as the objects in an hour folder are started within that hour
+'''
+def list_uncatalogued_objects(location, table_name, index, known_keys=None, end=None):
+    start_after = None
+    known = set()
+
+    if known_keys != None:
+        known.update(known_keys)
+
+    if index != None and index.get("watermark") != None:
+        lookback_start = index["watermark"] - index["lookbackHours"] * 3600
+        start_after = "%s/%s" % (table_name, time.strftime('%Y/%m/%d/%H', time.gmtime(lookback_start)))
+        known.update(index["recentKeys"])
+
+    for x in backup_store.list_table_objects(location, table_name, start_after):
+        # keys are listed in hour folder order, so no later object can have started before the end
+        if end != None and _hour_start(x['Key']) != None and _hour_start(x['Key']) > end:
+            break
+
+        if x['Key'] not in known:
+            yield x
+
+
+'''
+Keep only the keys in the index which the next update's lookback window will list again
+'''
+def _prune_recent_keys(index):
+    if index["watermark"] != None:
+        lookback_start = index["watermark"] - index["lookbackHours"] * 3600
+        index["recentKeys"] = sorted(set([x for x in index["recentKeys"] if _hour_start(x) != None and _hour_start(x) >= lookback_start]))
+
+
+'''
+Rewrite all the segments of a day as a single segment, updating the index. Returns the names of the replaced segments,
+which must only be deleted once the updated index has been written
+'''
+def _compact_day(location, table_name, index, day):
+    day_segments = [x for x in index["segments"] if x["Day"] == day]
+
+    entries = []
+    for x in day_segments:
+        entries.extend(_read_segment(location, table_name, x))
+
+    compacted = _write_segment(location, table_name, index, day, entries)
+    index["segments"] = [x for x in index["segments"] if x["Day"] != day] + [compacted]
+
+    return [x["Name"] for x in day_segments]
+
+
+'''
+Add the objects delivered since the last update to the catalog for a table, creating the catalog if required. An
+update reads no existing segments unless it compacts a day. A full update lists the whole table prefix, to find any
+objects delivered later than the lookback window, and applies the supplied lookback_hours to an existing catalog.
+Returns the number of entries added
+'''
+def update_catalog(location, table_name, lookback_hours=DEFAULT_LOOKBACK_HOURS, full=False):
+    index = load_index(location, table_name)
+    known_keys = None
+
+    if index == None:
+        index = {"segments": [], "nextSegment": 0, "watermark": None, "lookbackHours": lookback_hours, "recentKeys": []}
+    elif full:
+        known_keys = [x["Key"] for x in load_catalog(location, table_name, index=index)]
+        index["lookbackHours"] = lookback_hours
+        # a longer lookback window lists hour folders whose keys were dropped from the index, so these are rebuilt
+        index["recentKeys"] = known_keys
+
+    listing_index = None if full else index
+    new_entries = [catalog_entry(location, x) for x in list_uncatalogued_objects(location, table_name, listing_index, known_keys)]
+
+    catalogued = sum([x["Objects"] for x in index["segments"]])
+    if len(new_entries) == 0:
+        # a full update still applies its lookback window and rebuilt keys to the index
+        if full and known_keys != None:
+            _prune_recent_keys(index)
+            _write_index(location, table_name, index)
+
+        print "Catalog for %s is up to date with %s objects" % (table_name, catalogued)
+        return 0
+
+    # write a segment for each day of event time
+    days = {}
+    for x in new_entries:
+        days.setdefault(_day(x["StartTime"]), []).append(x)
+
+    for day in sorted(days.keys()):
+        index["segments"].append(_write_segment(location, table_name, index, day, days[day]))
+
+    replaced_segments = []
+    for day in sorted(days.keys()):
+        if len([x for x in index["segments"] if x["Day"] == day]) > MAX_DAY_SEGMENTS:
+            replaced_segments.extend(_compact_day(location, table_name, index, day))
+
+    index["segments"] = sorted(index["segments"], key=lambda x: (x["Day"], x["Name"]))
+
+    # move the watermark on, and keep the keys which the next update's lookback window will list again
+    hours = [_hour_start(x["Key"]) for x in new_entries if _hour_start(x["Key"]) != None]
+    if len(hours) > 0:
+        index["watermark"] = max(hours + [index["watermark"] or 0])
+
+    index["recentKeys"] = index["recentKeys"] + [x["Key"] for x in new_entries]
+    _prune_recent_keys(index)
+
+    # the index is only updated once the segments it names have been written
+    _write_index(location, table_name, index)
+
+    for x in replaced_segments:
+        backup_store.delete_object(location, _catalog_key(table_name, x))
+
+    print "Added %s objects to the catalog for %s, which now has %s objects" % (len(new_entries), table_name, catalogued + len(new_entries))
+
+    return len(new_entries)
+
+
+'''
+Return the catalog entries whose event time range overlaps the window from start to end (seconds since the epoch),
+either of which may be None to leave the window open
+'''
+def query_catalog(entries, start=None, end=None):
+    return [x for x in entries if _overlaps(x["StartTime"], x["EndTime"], start, end)]
+
+
+'''
+Generate the objects of a table which may hold events between start and end. Catalogued objects are returned as their
+catalog entries, read only from the segments overlapping the window, followed by the listings of any objects in the
+catalog's lookback window which are not yet catalogued. Objects in an hour folder are started within that hour, so the
+lookback window is not listed at all when the query ends before it, and is only listed up to the end otherwise. Without a catalog, or if use_catalog is False, the whole table prefix is listed
+'''
+def table_objects(location, table_name, start=None, end=None, use_catalog=True):
+    index = None
+    if use_catalog:
+        index = load_index(location, table_name)
+
+    if index != None:
+        for x in load_catalog(location, table_name, start, end, index):
+            yield x
+
+        if end != None and index["watermark"] != None and end < index["watermark"] - index["lookbackHours"] * 3600:
+            return
+
+    for x in list_uncatalogued_objects(location, table_name, index, end=end):
+        start_time = backup_store.key_timestamp(x['Key'])
+        if start_time == None:
+            start_time = x['LastModified']
+
+        if _overlaps(start_time, max(start_time, x['LastModified']), start, end):
+            yield x
@@ -0,0 +1,293 @@
+'''
+Module which restores a subset of items from continuous backup data into a live or scratch DynamoDB table.
+
+Backup events are streamed from the backup location and filtered by a key predicate, keeping only the latest image
+of each matched key. The latest images are then written to the target table at a rate which adapts to its capacity,
+backing off when writes are throttled so that the restore does not starve the application that shares the table
+'''
+
+import os
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import time
+import boto3
+import botocore
+import json
+import backup_catalog
+import backup_store
+
+REGION_KEY = 'AWS_REGION'
+BATCH_WRITE_LIMIT = 25
+PROGRESS_BATCHES = 40
+THROTTLE_ERRORS = ['ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded']
+
+# proportion of the target table's provisioned write capacity that a restore may use
+DEFAULT_CAPACITY_FRACTION = 0.5
+# write capacity units per second used as the ceiling for tables without provisioned capacity
+DEFAULT_MAX_WRITE_RATE = 100
+MIN_WRITE_RATE = 1.0
+# the longest Firehose buffering interval, used when the delivery interval of the backup is not known
+DEFAULT_DELIVERY_INTERVAL_SECONDS = 900
+# allowance for the Update Stream, LambdaStreamsToFirehose and Firehose to deliver a change later than its interval
+DELIVERY_LAG_MARGIN_SECONDS = 300
+
+dynamo_client = None
+
+
+def init():
+    try:
+        current_region = os.environ.get('AWS_DEFAULT_REGION', os.environ[REGION_KEY])
+
+        if current_region == None or current_region == '':
+            raise KeyError
+    except KeyError:
+        raise Exception("Unable to resolve what region to use. Please set AWS_DEFAULT_REGION.")
+
+    global dynamo_client
+    dynamo_client = boto3.client('dynamodb', region_name=current_region)
+
+
+'''
+Write rate limiter which grows the permitted write rate additively while writes succeed, and halves it when they are
+throttled. Rates are in write capacity units per second, and are charged after each write with the capacity consumed
+'''
+class AdaptiveWriteThrottle(object):
+    def __init__(self, max_rate, min_rate=MIN_WRITE_RATE):
+        self.max_rate = float(max(max_rate, min_rate))
+        self.min_rate = float(min_rate)
+        # start cautiously and ramp up, rather than opening with a burst against a busy table
+        self.rate = max(self.min_rate, self.max_rate / 4)
+        self.increase = max(self.max_rate / 20, 1.0)
+        self.next_write_time = time.time()
+        self.throttle_count = 0
+
+    def wait(self):
+        delay = self.next_write_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def consumed(self, capacity_units):
+        self.next_write_time = max(self.next_write_time, time.time()) + capacity_units / self.rate
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        self.throttle_count += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+
+        # leave the table alone for a full write interval before trying again
+        self.next_write_time = max(self.next_write_time, time.time()) + 1.0
+
+
+'''
+Resolve the write capacity units per second a restore may use against the target table. Writes also consume capacity
+on every Global Secondary Index, so the smallest provisioned capacity across the table and its indexes is used
+'''
+def resolve_max_write_rate(table_name, capacity_fraction=DEFAULT_CAPACITY_FRACTION, max_write_rate=DEFAULT_MAX_WRITE_RATE):
+    table = dynamo_client.describe_table(TableName=table_name)["Table"]
+
+    capacities = []
+    if "ProvisionedThroughput" in table:
+        capacities.append(table["ProvisionedThroughput"]["WriteCapacityUnits"])
+    for x in table.get("GlobalSecondaryIndexes", []):
+        if "ProvisionedThroughput" in x:
+            capacities.append(x["ProvisionedThroughput"]["WriteCapacityUnits"])
+
+    # on demand tables report zero provisioned capacity
+    capacities = [x for x in capacities if x > 0]
+
+    if len(capacities) == 0:
+        return max_write_rate
+    else:
+        return min(max_write_rate, max(MIN_WRITE_RATE, min(capacities) * capacity_fraction))
+
+
+'''
+Return the name of the hash key attribute of a table
+'''
+def get_hash_key_name(table_name):
+    table = dynamo_client.describe_table(TableName=table_name)["Table"]
+
+    for x in table["KeySchema"]:
+        if x["KeyType"] == "HASH":
+            return x["AttributeName"]
+
+
+def _canonical_key(keys):
+    return json.dumps(keys, sort_keys=True)
+
+
+'''
+Build a predicate over the 'Keys' of a backup record. Records match if their hash key value starts with the supplied
+prefix, or if their key is in the supplied list of keys (given in DynamoDB JSON, as they appear in the backup data).
+Supplying both restores the union of the two
+'''
+def key_predicate(hash_key_name=None, hash_key_prefix=None, keys=None):
+    key_set = None
+    if keys != None:
+        key_set = set([_canonical_key(x) for x in keys])
+
+    def matches(record_keys):
+        if key_set != None and _canonical_key(record_keys) in key_set:
+            return True
+
+        if hash_key_prefix != None and hash_key_name in record_keys:
+            # the hash key is a single typed value, such as {"S": "tenant1#abc"}
+            value = record_keys[hash_key_name].values()[0]
+            if unicode(value).startswith(hash_key_prefix):
+                return True
+
+        return False
+
+    return matches
+
+
+'''
+Stream the backup events for a table and return the latest event for every key which matches the predicate, as a dict
+of canonical key to event. With the optional 'until' time (seconds since the epoch), events whose
+ApproximateCreationDateTime is after it are skipped. Changes are delivered late, so objects started up to the
+delivery_interval plus a margin after 'until' are still read, and only objects started later than that are not read at
+all. The backup catalog is used to find the objects where the table has one
+'''
+def collect_latest_images(location, table_name, predicate, until=None, use_catalog=True, delivery_interval=DEFAULT_DELIVERY_INTERVAL_SECONDS):
+    latest = {}
+    object_count = 0
+    event_count = 0
+    skipped_count = 0
+    undated_count = 0
+
+    end = None
+    if until != None:
+        end = until + delivery_interval + DELIVERY_LAG_MARGIN_SECONDS
+
+    for x in backup_catalog.table_objects(location, table_name, end=end, use_catalog=use_catalog):
+        object_count += 1
+
+        # undated changes can only be placed in time by the object that holds them
+        if 'StartTime' in x:
+            object_start_time = x['StartTime']
+        else:
+            object_start_time = backup_store.key_timestamp(x['Key'])
+            if object_start_time == None:
+                object_start_time = x['LastModified']
+        object_end_time = x['EndTime'] if 'EndTime' in x else x['LastModified']
+
+        for record in backup_store.read_records(location, x['Key']):
+            if "Keys" not in record or not predicate(record["Keys"]):
+                continue
+
+            if until != None:
+                event_time = backup_store.record_event_time(record)
+                if (event_time != None and event_time > until) or (event_time == None and object_start_time > until):
+                    skipped_count += 1
+                    continue
+                elif event_time == None and object_end_time > until:
+                    undated_count += 1
+
+            event_count += 1
+            key = _canonical_key(record["Keys"])
+            sequence_number = int(record["SequenceNumber"])
+
+            if key not in latest or sequence_number > int(latest[key]["SequenceNumber"]):
+                latest[key] = record
+
+    print "Read %s backup objects for %s, finding %s matching events for %s keys" % (object_count, table_name, event_count, len(latest))
+
+    if skipped_count > 0:
+        print "Skipped %s matching events made after the restore point" % (skipped_count)
+    if undated_count > 0:
+        print "WARNING: %s matching events have no ApproximateCreationDateTime and were delivered after the restore point, so may have been made after it. They have been included" % (undated_count)
+
+    return latest
+
+
+'''
+Convert the latest backup events into BatchWriteItem requests - items which were removed are deleted, and all others
+are put with their latest image
+'''
+def build_write_requests(latest):
+    requests = []
+
+    for key, record in latest.items():
+        if record.get("eventName") == "REMOVE":
+            requests.append({"DeleteRequest": {"Key": record["Keys"]}})
+        elif "NewImage" in record:
+            requests.append({"PutRequest": {"Item": record["NewImage"]}})
+        else:
+            print "No NewImage in backup event for %s - the Update Stream is not NEW_AND_OLD_IMAGES. Skipping" % (key)
+
+    return requests
+
+
+'''
+Write requests to the target table in batches, adapting the write rate to the capacity of the table
+'''
+def write_requests(target_table_name, requests, throttle):
+    written = 0
+    start_time = time.time()
+
+    for i in range(0, len(requests), BATCH_WRITE_LIMIT):
+        pending = requests[i:i + BATCH_WRITE_LIMIT]
+
+        while len(pending) > 0:
+            throttle.wait()
+
+            try:
+                response = dynamo_client.batch_write_item(
+                    RequestItems={target_table_name: pending},
+                    ReturnConsumedCapacity='TOTAL'
+                )
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] in THROTTLE_ERRORS:
+                    throttle.throttled()
+                    print "Write throttled: reducing restore write rate to %.1f units per second" % (throttle.rate)
+                    continue
+                else:
+                    raise e
+
+            # charge at least one unit per item if the consumed capacity is not reported
+            capacity_units = sum([x.get("CapacityUnits", 0) for x in response.get("ConsumedCapacity", [])])
+            throttle.consumed(capacity_units if capacity_units > 0 else len(pending))
+
+            unprocessed = response.get("UnprocessedItems", {}).get(target_table_name, [])
+            written += len(pending) - len(unprocessed)
+
+            if len(unprocessed) > 0:
+                throttle.throttled()
+                print "%s Unprocessed Items: reducing restore write rate to %.1f units per second" % (len(unprocessed), throttle.rate)
+            else:
+                throttle.succeeded()
+
+            pending = unprocessed
+
+        if (i / BATCH_WRITE_LIMIT) % PROGRESS_BATCHES == 0 or i + BATCH_WRITE_LIMIT >= len(requests):
+            print "Restored %s of %s items to %s" % (written, len(requests), target_table_name)
+
+    print "Restore to %s completed in %.1f seconds with %s throttling events" % (target_table_name, time.time() - start_time, throttle.throttle_count)
+
+    return written
+
+
+'''
+Restore the latest image of every backed up item of source_table_name which matches the predicate into target_table_name.
+The delivery_interval is the firehoseDeliveryIntervalSeconds the backup was made with, which bounds how late changes
+before 'until' may have been delivered
+'''
+def restore(location, source_table_name, target_table_name, predicate, until=None, capacity_fraction=DEFAULT_CAPACITY_FRACTION, max_write_rate=DEFAULT_MAX_WRITE_RATE, dry_run=False, use_catalog=True, delivery_interval=DEFAULT_DELIVERY_INTERVAL_SECONDS):
+    latest = collect_latest_images(location, source_table_name, predicate, until, use_catalog, delivery_interval)
+    requests = build_write_requests(latest)
+
+    deletes = len([x for x in requests if "DeleteRequest" in x])
+    print "Restoring %s items and deleting %s items in %s" % (len(requests) - deletes, deletes, target_table_name)
+
+    if dry_run or len(requests) == 0:
+        return 0
+
+    throttle = AdaptiveWriteThrottle(resolve_max_write_rate(target_table_name, capacity_fraction, max_write_rate))
+    print "Writing at up to %.1f capacity units per second" % (throttle.max_rate)
+
+    return write_requests(target_table_name, requests, throttle)
@@ -0,0 +1,278 @@
+'''
+Module which provides access to the continuous backup data that Kinesis Firehose has delivered, either on
+Amazon S3 or on a local copy of the bucket layout (for example one created with 'aws s3 sync').
+
+A backup location is either 's3://<firehoseDeliveryBucket>/<firehoseDeliveryPrefix>' or a local directory which holds
+the same structure, and in both cases contains one folder per table with the Firehose 'YYYY/MM/DD/HH' date layout below it
+'''
+
+import os
+import re
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import calendar
+import gzip
+import io
+import json
+import boto3
+import botocore
+
+REGION_KEY = 'AWS_REGION'
+S3_SCHEME = 's3://'
+
+# Firehose object names end with <DeliveryStreamName>-<Version>-YYYY-MM-DD-HH-MM-SS-<uuid>
+OBJECT_TIMESTAMP_PATTERN = re.compile('-(\d{4})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-[^/]+$')
+HOUR_PATH_PATTERN = re.compile('(?:^|/)(\d{4})/(\d{2})/(\d{2})/(\d{2})/')
+GZIP_MAGIC = b'\x1f\x8b'
+CATALOG_DIRECTORY = '_catalog'
+# event times larger than this are in milliseconds rather than seconds (it is in the year 5138 in seconds)
+MILLISECOND_TIMESTAMP_THRESHOLD = 10 ** 11
+
+s3_client = None
+
+
+'''
+Return a connection to S3 in the current region, creating it if required
+'''
+def get_s3_client():
+    global s3_client
+
+    if s3_client == None:
+        current_region = os.environ.get('AWS_DEFAULT_REGION', os.environ.get(REGION_KEY))
+        if current_region == None or current_region == '':
+            raise Exception("Unable to resolve what region to use. Please set AWS_DEFAULT_REGION.")
+
+        s3_client = boto3.client('s3', region_name=current_region)
+
+    return s3_client
+
+
+'''
+Build the default backup location from the module configuration
+'''
+def location_from_config(config):
+    return "%s%s/%s" % (S3_SCHEME, config['firehoseDeliveryBucket'], config['firehoseDeliveryPrefix'])
+
+
+'''
+Split a backup location into a bucket and base prefix. Local locations return a bucket of None and the directory path
+'''
+def resolve_location(location):
+    if location.startswith(S3_SCHEME):
+        tokens = location[len(S3_SCHEME):].split("/", 1)
+        bucket = tokens[0]
+        prefix = tokens[1].strip("/") if len(tokens) > 1 else ''
+
+        return bucket, prefix
+    else:
+        return None, location.rstrip(os.sep)
+
+
+def _join_prefix(prefix, key):
+    if prefix == '':
+        return key
+    else:
+        return "%s/%s" % (prefix, key)
+
+
+'''
+Find the names of all tables which have backup data in the location
+'''
+def list_tables(location):
+    bucket, base = resolve_location(location)
+    tables = []
+
+    if bucket == None:
+        for x in sorted(os.listdir(base)):
+            if os.path.isdir(os.path.join(base, x)):
+                tables.append(x)
+    else:
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=_join_prefix(base, ''), Delimiter='/'):
+            for x in page.get('CommonPrefixes', []):
+                tables.append(x['Prefix'].rstrip('/').split('/')[-1])
+
+    # the backup catalog is kept alongside the table folders
+    return [x for x in tables if x != CATALOG_DIRECTORY]
+
+
+'''
+Generate the objects below a key prefix of the location in key order. Each object is returned as a dict with the 'Key'
+relative to the backup location, its 'Size' in bytes, and 'LastModified' as seconds since the epoch. If start_after is
+supplied then only keys which sort after it are returned
+'''
+def list_objects(location, prefix, start_after=None):
+    bucket, base = resolve_location(location)
+
+    if bucket == None:
+        keys = []
+        for root, dirs, files in os.walk(os.path.join(base, *prefix.strip('/').split('/'))):
+            for f in files:
+                path = os.path.join(root, f)
+                keys.append(os.path.relpath(path, base).replace(os.sep, '/'))
+
+        for key in sorted(keys):
+            if start_after != None and key <= start_after:
+                continue
+
+            stat = os.stat(os.path.join(base, *key.split('/')))
+            yield {'Key': key, 'Size': stat.st_size, 'LastModified': stat.st_mtime}
+    else:
+        args = {'Bucket': bucket, 'Prefix': _join_prefix(base, prefix)}
+        if start_after != None:
+            args['StartAfter'] = _join_prefix(base, start_after)
+
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(**args):
+            for x in page.get('Contents', []):
+                yield {
+                    'Key': x['Key'][len(_join_prefix(base, '')):],
+                    'Size': x['Size'],
+                    'LastModified': calendar.timegm(x['LastModified'].utctimetuple())
+                }
+
+
+'''
+Generate the backup objects for a table in key order, as for list_objects
+'''
+def list_table_objects(location, table_name, start_after=None):
+    return list_objects(location, table_name + '/', start_after)
+
+
+'''
+Determine whether an object exists in the location
+'''
+def object_exists(location, key):
+    bucket, base = resolve_location(location)
+
+    if bucket == None:
+        return os.path.isfile(os.path.join(base, *key.split('/')))
+    else:
+        try:
+            get_s3_client().head_object(Bucket=bucket, Key=_join_prefix(base, key))
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                return False
+            else:
+                raise e
+
+
+'''
+Write an object to the location, replacing any existing object with the same key
+'''
+def write_object(location, key, data):
+    bucket, base = resolve_location(location)
+
+    if bucket == None:
+        path = os.path.join(base, *key.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        f = open(path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+    else:
+        get_s3_client().put_object(Bucket=bucket, Key=_join_prefix(base, key), Body=data)
+
+
+'''
+Remove an object from the location
+'''
+def delete_object(location, key):
+    bucket, base = resolve_location(location)
+
+    if bucket == None:
+        path = os.path.join(base, *key.split('/'))
+        if os.path.isfile(path):
+            os.remove(path)
+    else:
+        get_s3_client().delete_object(Bucket=bucket, Key=_join_prefix(base, key))
+
+
+'''
+Read the contents of a backup object, decompressing it if Firehose delivered it with GZIP compression
+'''
+def read_object(location, key):
+    bucket, base = resolve_location(location)
+
+    if bucket == None:
+        f = open(os.path.join(base, *key.split('/')), 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    else:
+        data = get_s3_client().get_object(Bucket=bucket, Key=_join_prefix(base, key))['Body'].read()
+
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+    return data
+
+
+'''
+Parse the update stream records in an object. LambdaStreamsToFirehose normally writes one JSON document per line,
+but documents are also accepted when written back to back
+'''
+def parse_records(data):
+    text = data.decode('utf-8')
+    decoder = json.JSONDecoder()
+    position = 0
+    end = len(text)
+
+    while position < end:
+        while position < end and text[position].isspace():
+            position += 1
+
+        if position >= end:
+            break
+
+        record, position = decoder.raw_decode(text, position)
+
+        yield record
+
+
+'''
+Generate all the update stream records in a single backup object
+'''
+def read_records(location, key):
+    return parse_records(read_object(location, key))
+
+
+'''
+Resolve the time (seconds since the epoch) of the change in an update stream record from its ApproximateCreationDateTime,
+or None if the record does not carry one. Values in milliseconds are converted to seconds
+'''
+def record_event_time(record):
+    event_time = record.get("ApproximateCreationDateTime")
+
+    if event_time == None:
+        return None
+    elif event_time > MILLISECOND_TIMESTAMP_THRESHOLD:
+        return event_time / 1000.0
+    else:
+        return event_time
+
+
+'''
+Resolve the approximate time (seconds since the epoch) at which Firehose started writing an object, using the object
+name timestamp, or failing that the YYYY/MM/DD/HH path. Returns None if neither can be found
+'''
+def key_timestamp(key):
+    match = OBJECT_TIMESTAMP_PATTERN.search(key)
+    if match == None:
+        match = HOUR_PATH_PATTERN.search(key)
+
+    if match == None:
+        return None
+    else:
+        values = [int(x) for x in match.groups()]
+        values.extend([0] * (6 - len(values)))
+
+        return calendar.timegm(values)
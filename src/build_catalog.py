@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import backup_catalog
+import backup_store
+import argparse
+import hjson
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", dest='config_file', action='store', required=False, help="The HJSON configuration file used to build the backup module")
+    parser.add_argument("--location", dest='location', action='store', required=False, help="s3://bucket/prefix or local directory holding the backup data. Defaults to the configured Firehose destination")
+    parser.add_argument("--lookback-hours", dest='lookback_hours', action='store', type=int, default=backup_catalog.DEFAULT_LOOKBACK_HOURS, help="Hours of Firehose folders before the latest catalogued hour to list again for late delivered objects. Applies to new catalogs, or existing ones with --full")
+    parser.add_argument("--full", dest='full', action='store_true', required=False, help="List the whole table prefix to find objects delivered later than the lookback window")
+    parser.add_argument('tables', nargs='*', help='Tables to catalog. Defaults to all tables found in the backup location')
+    args = parser.parse_args()
+
+    if args.location != None:
+        location = args.location
+    elif args.config_file != None:
+        location = backup_store.location_from_config(hjson.load(open(args.config_file, 'r')))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    tables = args.tables
+    if len(tables) == 0:
+        tables = backup_store.list_tables(location)
+
+    for x in tables:
+        try:
+            backup_catalog.update_catalog(location, x, args.lookback_hours, args.full)
+        except Exception as e:
+            print "Exception while updating the catalog for table %s" % (x)
+            print e
+            print "Proceeding..."
@@ -10,7 +10,8 @@ import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--threads", dest='threads', action='store', type=int, default=setup_existing_tables.DEFAULT_DEPROVISION_THREADS, help="Number of tables to deprovision concurrently")
     parser.add_argument('whitelist_configuration', help='whitelist_configuration.hjson')
     args = parser.parse_args()
 
-    setup_existing_tables.deprovision(args.whitelist_configuration)
+    setup_existing_tables.deprovision(args.whitelist_configuration, args.threads)
@@ -62,6 +62,16 @@ LAMBDA_STREAMS_TO_FIREHOSE_VERSION = "1.5.1"
 LAMBDA_STREAMS_TO_FIREHOSE_BUCKET = "awslabs-code"
 LAMBDA_STREAMS_TO_FIREHOSE_PREFIX = "LambdaStreamToFirehose"
 CONF_LOC = 'config.loc'
+DELIVERY_STREAM_DELETE_TIMEOUT = 240
+DELIVERY_STREAM_POLL_INTERVAL = 5
+# time kept back from the Lambda timeout for the provisioning which follows the wait for a Delivery Stream deletion
+PROVISIONING_RESERVE_SECONDS = 30
+DEFAULT_FORWARDER_POOL_SIZE = 1
+DEFAULT_FORWARDER_MEMORY_SIZE = 128
+DEFAULT_FORWARDER_TIMEOUT = 300
+DEFAULT_TABLE_WRITE_RATE = 1.0
+DEFAULT_REBALANCE_THRESHOLD = 0.25
+REQUIRED = object()
 dynamo_client = None
 dynamo_resource = None
 current_region = None
@@ -70,13 +80,16 @@ lambda_client = None
 
 
 '''
-Configuration accessor. Rule is to access the provided configuration first, and then fall back to Environment Variables
+Configuration accessor. Rule is to access the provided configuration first, and then fall back to Environment Variables,
+and then to the default if one is supplied
 '''
-def get_config_value(key):
+def get_config_value(key, default=REQUIRED):
     if config != None and key in config:
         return config[key]
     elif key in os.environ:
         return os.environ[key]
+    elif default is not REQUIRED:
+        return default
     else:
         raise Exception("Unable to establish location of Config. %s not found" % (key))
 
@@ -201,53 +214,198 @@ def get_delivery_stream_name(dynamo_table_name):
 
 
 '''
-Check that we have a Firehose Delivery Stream of the same name as the provided DynamoDB Table. If not, then create it
+Describe a Firehose Delivery Stream, backing off when throttled. Returns None if the Delivery Stream does not exist
 '''
-def ensure_firehose_delivery_stream(dynamo_table_name):
-    response = None
-
-    delivery_stream_name = get_delivery_stream_name(dynamo_table_name)
-    
-    ok = False
+def describe_delivery_stream(delivery_stream_name):
     tries = 0
     try_count = 100
-    while not ok and tries < try_count:
+    while tries < try_count:
         try:
-            response = firehose_client.describe_delivery_stream(DeliveryStreamName=delivery_stream_name)
-            ok = True
+            return firehose_client.describe_delivery_stream(DeliveryStreamName=delivery_stream_name)
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                ok = True
-                break
+                return None
             if e.response['Error']['Code'] == 'LimitExceededException' or e.response['Error']['Code'] == 'ThrottlingException':
                 # exponential backoff with base of 100 ms up to 3 seconds
-                interval = max(.1 * pow(2, try_count), 3)
+                interval = min(.1 * pow(2, tries), 3)
                 print "Limit Exceeded: Backing off for %s seconds" % (interval)
                 time.sleep(interval)
                 tries += 1
             else:
                 raise e
-    
-    if not ok:
-        raise Exception("Unable to resolve Firehose Delivery Stream presence in 100 attempts. Aborting")
-    else:
-        if response and response["DeliveryStreamDescription"]["DeliveryStreamARN"]:
-            delivery_stream_arn = response["DeliveryStreamDescription"]["DeliveryStreamARN"]
-    
-            return delivery_stream_arn
+
+    raise Exception("Unable to resolve Firehose Delivery Stream presence in %s attempts. Aborting" % (try_count))
+
+
+'''
+Raised when a Firehose Delivery Stream is still being deleted once the time allowed to wait for it has passed. The
+provisioning which raised it can safely be retried
+'''
+class DeliveryStreamDeletingException(Exception):
+    pass
+
+
+'''
+Wait for a Firehose Delivery Stream which is DELETING to be removed completely
+'''
+def wait_for_delivery_stream_deletion(delivery_stream_name, timeout=DELIVERY_STREAM_DELETE_TIMEOUT):
+    print "Waiting up to %.0f seconds for deletion of Firehose Delivery Stream %s" % (timeout, delivery_stream_name)
+
+    start_time = time.time()
+    while describe_delivery_stream(delivery_stream_name) != None:
+        if time.time() - start_time + DELIVERY_STREAM_POLL_INTERVAL > timeout:
+            raise DeliveryStreamDeletingException("Firehose Delivery Stream %s is still being deleted after %.0f seconds. Provisioning must be retried once the deletion has completed" % (delivery_stream_name, time.time() - start_time))
+
+        time.sleep(DELIVERY_STREAM_POLL_INTERVAL)
+
+    print "Firehose Delivery Stream %s deleted after %.1f seconds" % (delivery_stream_name, time.time() - start_time)
+
+
+'''
+Return the set of names of all Firehose Delivery Streams in the region, including those which are being deleted
+'''
+def list_delivery_stream_names():
+    names = set()
+    args = {}
+
+    while True:
+        response = firehose_client.list_delivery_streams(**args)
+        names.update(response['DeliveryStreamNames'])
+
+        if response['HasMoreDeliveryStreams'] and len(response['DeliveryStreamNames']) > 0:
+            args['ExclusiveStartDeliveryStreamName'] = response['DeliveryStreamNames'][-1]
         else:
-            # delivery stream doesn't exist, so create it
-            delivery_stream_arn = create_delivery_stream(delivery_stream_name)
+            break
+
+    return names
+
+
+'''
+Check that we have a Firehose Delivery Stream of the same name as the provided DynamoDB Table. If not, then create it
+'''
+def ensure_firehose_delivery_stream(dynamo_table_name, delete_timeout=DELIVERY_STREAM_DELETE_TIMEOUT):
+    delivery_stream_name = get_delivery_stream_name(dynamo_table_name)
     
-        return delivery_stream_arn
+    response = describe_delivery_stream(delivery_stream_name)
+
+    # a table recreated with the name of one just deleted must not be given the Delivery Stream that is being torn down
+    if response and response["DeliveryStreamDescription"]["DeliveryStreamStatus"] == 'DELETING':
+        wait_for_delivery_stream_deletion(delivery_stream_name, delete_timeout)
+        response = None
+
+    if response and response["DeliveryStreamDescription"]["DeliveryStreamARN"]:
+        delivery_stream_arn = response["DeliveryStreamDescription"]["DeliveryStreamARN"]
+    else:
+        # delivery stream doesn't exist, so create it
+        delivery_stream_arn = create_delivery_stream(delivery_stream_name)
+
+    return delivery_stream_arn
+
+
+'''
+Name of a member of the pool of LambdaStreamsToFirehose forwarder functions. The first member keeps the original
+function name, so that existing deployments become the first member of the pool
+'''
+def get_forwarder_function_name(index):
+    if index == 0:
+        return LAMBDA_STREAMS_TO_FIREHOSE
+    else:
+        return "%s-%s" % (LAMBDA_STREAMS_TO_FIREHOSE, index)
 
 
 '''
-Wire the DynamoDB Update Stream to LambdaStreamsToFirehose, if it isn't already
+Names of all the forwarder functions in the configured pool
+'''
+def get_forwarder_pool():
+    pool_size = int(get_config_value('forwarderPoolSize', DEFAULT_FORWARDER_POOL_SIZE))
+
+    return [get_forwarder_function_name(x) for x in range(max(1, pool_size))]
+
+
+'''
+Resolve the name of the forwarder function from the FunctionArn of an event source mapping, or None if the function is
+not a LambdaStreamsToFirehose forwarder. Any pool member is matched, including those beyond the configured pool size
+'''
+def get_forwarder_function(function_arn):
+    function_name = function_arn.split(":")[6] if function_arn.startswith("arn:") else function_arn
+
+    if function_name == LAMBDA_STREAMS_TO_FIREHOSE or re.match("^%s-\\d+$" % (LAMBDA_STREAMS_TO_FIREHOSE), function_name):
+        return function_name
+    else:
+        return None
+
+
+'''
+Resolve the name of the DynamoDB table from a DynamoDB Update Stream ARN, or None if the ARN is not a DynamoDB one
+'''
+def get_event_source_table(event_source_arn):
+    event_source_tokens = event_source_arn.split(":")
+
+    if event_source_tokens[2] == 'dynamodb':
+        return event_source_tokens[5].split("/")[1]
+    else:
+        return None
+
+
+'''
+Expected write rate of a table, used to balance tables across the forwarder pool. Rates supplied in the
+'tableWriteRates' configuration take precedence over the table's provisioned write capacity. Callers supply a dict of
+rates which is only kept for a single placement or rebalance, so that deleted, recreated and resized tables are seen
+'''
+def get_table_write_rate(dynamo_table_name, table_write_rates):
+    if dynamo_table_name in table_write_rates:
+        return table_write_rates[dynamo_table_name]
+
+    configured_rates = get_config_value('tableWriteRates', {})
+    if isinstance(configured_rates, dict) and dynamo_table_name in configured_rates:
+        rate = float(configured_rates[dynamo_table_name])
+    else:
+        try:
+            table = dynamo_client.describe_table(TableName=dynamo_table_name)["Table"]
+
+            # on demand tables have no provisioned capacity to go on
+            rate = float(table["ProvisionedThroughput"]["WriteCapacityUnits"])
+            if rate == 0:
+                rate = DEFAULT_TABLE_WRITE_RATE
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                # the table has been deleted, so its stream will not be producing any more writes
+                rate = 0.0
+            else:
+                raise e
+
+    table_write_rates[dynamo_table_name] = rate
+
+    return rate
+
+
+'''
+Total expected write rate of the tables mapped to each forwarder function, from a dict of function name to mappings
+'''
+def get_forwarder_loads(forwarder_mappings, table_write_rates):
+    loads = {}
+    for function_name, mappings in forwarder_mappings.items():
+        loads[function_name] = sum([get_table_write_rate(get_event_source_table(x['EventSourceArn']), table_write_rates) for x in mappings if get_event_source_table(x['EventSourceArn']) != None])
+
+    return loads
+
+
+'''
+Wire the DynamoDB Update Stream to the least loaded LambdaStreamsToFirehose forwarder in the pool, if it isn't already
 '''
 def ensure_update_stream_event_source(dynamo_stream_arn):
+    # the stream must only ever be mapped to one forwarder, which may be outside the pool if it has been shrunk
+    for mapping in list_event_source_mappings(EventSourceArn=dynamo_stream_arn):
+        print "DynamoDB Update Stream %s already routed to %s" % (dynamo_stream_arn, get_forwarder_function(mapping['FunctionArn']))
+        return
+
+    forwarder_mappings = list_forwarder_event_source_mappings()
+    table_write_rates = {}
+    loads = get_forwarder_loads(forwarder_mappings, table_write_rates)
+    function_name = min(get_forwarder_pool(), key=lambda x: loads[x])
+
     # ensure that we have a lambda streams to firehose function
-    function_arn = ensure_lambda_streams_to_firehose()
+    function_arn = ensure_lambda_streams_to_firehose(function_name)
 
     # map the dynamo update stream as a source for this function
     try:
@@ -258,6 +416,8 @@ def ensure_update_stream_event_source(dynamo_stream_arn):
             BatchSize=get_config_value('streamsMaxRecordsBatch'),
             StartingPosition='TRIM_HORIZON'
         )
+
+        print "Routed DynamoDB Update Stream %s to %s" % (dynamo_stream_arn, function_name)
     except botocore.exceptions.ClientError as e:
         if e.response['Error']['Code'] == 'ResourceConflictException':
             pass
@@ -266,19 +426,35 @@ def ensure_update_stream_event_source(dynamo_stream_arn):
 
 
 '''
-Deploy the LambdaStreamsToFirehose module (https://github.com/awslabs/lambda-streams-to-firehose) if it is not deployed already
+Deploy the LambdaStreamsToFirehose module (https://github.com/awslabs/lambda-streams-to-firehose) as the named member of
+the forwarder pool if it is not deployed already, and apply the configured pool memory, timeout and concurrency settings
 '''
-def ensure_lambda_streams_to_firehose():
+def ensure_lambda_streams_to_firehose(function_name=LAMBDA_STREAMS_TO_FIREHOSE):
+    memory_size = int(get_config_value('forwarderMemorySize', DEFAULT_FORWARDER_MEMORY_SIZE))
+    timeout = int(get_config_value('forwarderTimeout', DEFAULT_FORWARDER_TIMEOUT))
+    reserved_concurrency = get_config_value('forwarderReservedConcurrency', None)
+
     # make sure we have the LambdaStreamsToFirehose function deployed
     response = None
     try:
-        response = lambda_client.get_function(FunctionName=LAMBDA_STREAMS_TO_FIREHOSE)
+        response = lambda_client.get_function(FunctionName=function_name)
     except botocore.exceptions.ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
             pass
 
     if response and response["Configuration"]["FunctionArn"]:
         function_arn = response["Configuration"]["FunctionArn"]
+
+        if response["Configuration"]["MemorySize"] != memory_size or response["Configuration"]["Timeout"] != timeout:
+            lambda_client.update_function_configuration(
+                FunctionName=function_name,
+                Timeout=timeout,
+                MemorySize=memory_size
+            )
+
+            print "Updated %s to %s MB Memory and %s second Timeout" % (function_name, memory_size, timeout)
+
+        current_concurrency = response.get("Concurrency", {}).get("ReservedConcurrentExecutions")
     else:
         deployment_package = "%s/%s-%s.zip" % (LAMBDA_STREAMS_TO_FIREHOSE_PREFIX, LAMBDA_STREAMS_TO_FIREHOSE, LAMBDA_STREAMS_TO_FIREHOSE_VERSION)
         
@@ -290,7 +466,7 @@ def ensure_lambda_streams_to_firehose():
         print "Deploying %s from s3://%s" % (deployment_package, deploy_bucket)
         try:
             response = lambda_client.create_function(
-                FunctionName=LAMBDA_STREAMS_TO_FIREHOSE,
+                FunctionName=function_name,
                 Runtime='nodejs4.3',
                 Role=get_config_value('lambdaExecRoleArn'),
                 Handler='index.handler',
@@ -299,80 +475,234 @@ def ensure_lambda_streams_to_firehose():
                     'S3Key': deployment_package
                 },
                 Description="AWS Lambda Streams to Kinesis Firehose Replicator",
-                Timeout=300,
-                MemorySize=128,
+                Timeout=timeout,
+                MemorySize=memory_size,
                 Publish=True
             )
+
+            function_arn = response["FunctionArn"]
+            print "Created New Function %s:%s" % (function_name, function_arn)
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == 'ResourceConflictException':
                 # the function somehow already exists, though the get previously failed
-                pass
+                function_arn = lambda_client.get_function(FunctionName=function_name)["Configuration"]["FunctionArn"]
             else:
                 raise e
 
-        if response:
-            function_arn = response["FunctionArn"]
-            print "Created New Function %s:%s" % (LAMBDA_STREAMS_TO_FIREHOSE, function_arn)
+        current_concurrency = None
+
+    if reserved_concurrency != None and current_concurrency != int(reserved_concurrency):
+        lambda_client.put_function_concurrency(
+            FunctionName=function_name,
+            ReservedConcurrentExecutions=int(reserved_concurrency)
+        )
+
+        print "Reserved Concurrency of %s for %s" % (reserved_concurrency, function_name)
 
     return function_arn
 
 
 '''
-Removes a Firehose Delivery Stream, without affecting S3 in any way
+Removes a Firehose Delivery Stream, without affecting S3 in any way. Deletion completes asynchronously, so this returns
+the name of the Delivery Stream being deleted, or None if there was no Delivery Stream for the table
 '''
 def delete_fh_stream(for_table_name):
-    try:
-        delivery_stream_name = get_delivery_stream_name(for_table_name)
+    delivery_stream_name = get_delivery_stream_name(for_table_name)
 
+    try:
         firehose_client.delete_delivery_stream(
             DeliveryStreamName=delivery_stream_name
         )
 
-        print "Deleted Firehose Delivery Stream %s" % (delivery_stream_name)
+        print "Deleting Firehose Delivery Stream %s" % (delivery_stream_name)
+
+        return delivery_stream_name
     except botocore.exceptions.ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
             print "No Firehose Delivery Stream %s Found - OK" % (delivery_stream_name)
 
+            return None
+        elif e.response['Error']['Code'] == 'ResourceInUseException':
+            # a previous deprovision may already have started deleting the stream
+            response = describe_delivery_stream(delivery_stream_name)
+            if response == None:
+                return None
+            elif response["DeliveryStreamDescription"]["DeliveryStreamStatus"] == 'DELETING':
+                print "Firehose Delivery Stream %s is already being deleted - OK" % (delivery_stream_name)
+
+                return delivery_stream_name
+
+        raise e
+
 
 '''
-Remove the routing of any DynamoDB Update Streams to LambdaStreamsToFirehose
+List the event source mappings which route to any LambdaStreamsToFirehose forwarder function, optionally only those of
+a single DynamoDB Update Stream
 '''
-def remove_stream_trigger(dynamo_table_name):
-    # find any update streams that route to Lambda Streams to Firehose and remove them
-    event_source_mappings = lambda_client.list_event_source_mappings(FunctionName=LAMBDA_STREAMS_TO_FIREHOSE)
-    removed_stream_trigger = False
+def list_event_source_mappings(**kwargs):
+    event_source_mappings = []
+
+    paginator = lambda_client.get_paginator('list_event_source_mappings')
+    for page in paginator.paginate(**kwargs):
+        event_source_mappings.extend([x for x in page['EventSourceMappings'] if get_forwarder_function(x['FunctionArn']) != None])
+
+    return event_source_mappings
+
+
+'''
+List the event source mappings of the forwarder functions as a dict of function name to mappings. Every member of the
+configured pool is included, as are any members beyond the pool size which still have mappings
+'''
+def list_forwarder_event_source_mappings():
+    forwarder_mappings = dict([(x, []) for x in get_forwarder_pool()])
 
-    for mapping in  event_source_mappings['EventSourceMappings']:
-        event_source_tokens = mapping['EventSourceArn'].split(":")
+    for mapping in list_event_source_mappings():
+        forwarder_mappings.setdefault(get_forwarder_function(mapping['FunctionArn']), []).append(mapping)
 
-        # check if this is a dynamo DB event
-        event_source_service = event_source_tokens[2]
+    return forwarder_mappings
 
-        if event_source_service == 'dynamodb':
-            # check if the table matches
-            event_source_table = event_source_tokens[5].split("/")[1]
 
-            if event_source_table == dynamo_table_name:
+'''
+List all the event source mappings which route to the LambdaStreamsToFirehose forwarder functions
+'''
+def list_stream_event_source_mappings():
+    return list_event_source_mappings()
+
+
+'''
+Remove the routing of any DynamoDB Update Streams to LambdaStreamsToFirehose. Callers removing many tables can supply
+the result of list_stream_event_source_mappings() so that it is only listed once
+'''
+def remove_stream_trigger(dynamo_table_name, event_source_mappings=None):
+    # find any update streams that route to Lambda Streams to Firehose and remove them
+    if event_source_mappings == None:
+        event_source_mappings = list_stream_event_source_mappings()
+    removed_stream_trigger = False
+
+    for mapping in event_source_mappings:
+        # check if this is a dynamo DB event for the table
+        if get_event_source_table(mapping['EventSourceArn']) == dynamo_table_name:
+            try:
                 lambda_client.delete_event_source_mapping(UUID=mapping["UUID"])
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                    raise e
+            removed_stream_trigger = True
 
-                print "Removed Event Source Mapping for DynamoDB Update Stream %s" % (mapping["EventSourceArn"])
+            print "Removed Event Source Mapping for DynamoDB Update Stream %s" % (mapping["EventSourceArn"])
 
     if not removed_stream_trigger:
         print "No DynamoDB Update Stream Triggers found routing to %s for %s - OK" % (LAMBDA_STREAMS_TO_FIREHOSE, dynamo_table_name)
 
+
 '''
-Provision a single table for DynamoDB backup
+Move event source mappings between members of the forwarder pool until no member carries more than
+(1 + threshold) times the average expected write rate, or no move can reduce the skew further. Mappings are moved with
+UpdateEventSourceMapping, so they keep their position in the Update Stream
+'''
+def rebalance_forwarders(threshold=DEFAULT_REBALANCE_THRESHOLD, dry_run=False):
+    pool = get_forwarder_pool()
+
+    # every member must exist before mappings can be moved to it
+    if not dry_run:
+        for function_name in pool:
+            ensure_lambda_streams_to_firehose(function_name)
+
+    forwarder_mappings = list_forwarder_event_source_mappings()
+    table_write_rates = {}
+    loads = get_forwarder_loads(forwarder_mappings, table_write_rates)
+    average = sum(loads.values()) / len(pool)
+
+    for function_name in sorted(forwarder_mappings.keys()):
+        print "%s: %s Update Streams, expected write rate %.1f" % (function_name, len(forwarder_mappings[function_name]), loads[function_name])
+
+    moves = 0
+
+    # forwarders beyond the pool size are left over from a larger pool, so all their mappings move into the pool
+    for function_name in [x for x in forwarder_mappings.keys() if x not in pool]:
+        for mapping in list(forwarder_mappings[function_name]):
+            table_name = get_event_source_table(mapping['EventSourceArn'])
+            rate = get_table_write_rate(table_name, table_write_rates) if table_name != None else 0.0
+            lightest = min(pool, key=lambda x: loads[x])
+
+            print "Moving DynamoDB Update Stream %s (expected write rate %.1f) from %s, which is outside the pool, to %s" % (mapping['EventSourceArn'], rate, function_name, lightest)
+
+            if not dry_run:
+                try:
+                    lambda_client.update_event_source_mapping(UUID=mapping['UUID'], FunctionName=lightest)
+                except botocore.exceptions.ClientError as e:
+                    if e.response['Error']['Code'] == 'ResourceInUseException':
+                        print "Event Source Mapping %s is in use - skipping" % (mapping['UUID'])
+                        continue
+                    else:
+                        raise e
+
+            forwarder_mappings[function_name].remove(mapping)
+            forwarder_mappings[lightest].append(mapping)
+            loads[function_name] -= rate
+            loads[lightest] += rate
+            moves += 1
+
+    while len(pool) > 1:
+        heaviest = max(pool, key=lambda x: loads[x])
+        lightest = min(pool, key=lambda x: loads[x])
+        gap = loads[heaviest] - loads[lightest]
+
+        if loads[heaviest] <= (1 + threshold) * average:
+            break
+
+        # move the largest table which does not make the lightest forwarder heavier than the heaviest one is now
+        candidates = [x for x in forwarder_mappings[heaviest] if get_event_source_table(x['EventSourceArn']) != None]
+        candidates = [x for x in candidates if 0 < get_table_write_rate(get_event_source_table(x['EventSourceArn']), table_write_rates) < gap]
+        if len(candidates) == 0:
+            break
+
+        mapping = max(candidates, key=lambda x: get_table_write_rate(get_event_source_table(x['EventSourceArn']), table_write_rates))
+        rate = get_table_write_rate(get_event_source_table(mapping['EventSourceArn']), table_write_rates)
+
+        print "Moving DynamoDB Update Stream %s (expected write rate %.1f) from %s to %s" % (mapping['EventSourceArn'], rate, heaviest, lightest)
+
+        if not dry_run:
+            try:
+                lambda_client.update_event_source_mapping(UUID=mapping['UUID'], FunctionName=lightest)
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] == 'ResourceInUseException':
+                    # the mapping is being changed by something else, so leave it where it is
+                    print "Event Source Mapping %s is in use - skipping" % (mapping['UUID'])
+                    forwarder_mappings[heaviest].remove(mapping)
+                    continue
+                else:
+                    raise e
+
+        forwarder_mappings[heaviest].remove(mapping)
+        forwarder_mappings[lightest].append(mapping)
+        loads[heaviest] -= rate
+        loads[lightest] += rate
+        moves += 1
+
+    print "Rebalanced forwarder pool with %s moves. Expected write rates: %s" % (moves, ", ".join(["%s=%.1f" % (x, loads[x]) for x in pool]))
+
+    return moves
+
 '''
-def configure_table(dynamo_table_name):
+Provision a single table for DynamoDB backup. When running in AWS Lambda, supply the invocation context so that waiting
+for a previous Delivery Stream of the same name to be deleted cannot run past the function timeout. In that case a
+DeliveryStreamDeletingException is raised, and the retry of the invocation completes the provisioning
+'''
+def configure_table(dynamo_table_name, context=None):
     proceed = optin_function(dynamo_table_name)
 
+    delete_timeout = DELIVERY_STREAM_DELETE_TIMEOUT
+    if context != None:
+        delete_timeout = min(delete_timeout, max(0, context.get_remaining_time_in_millis() / 1000.0 - PROVISIONING_RESERVE_SECONDS))
+
     # ensure that the table has an update stream
     if proceed:
         dynamo_stream_arn = ensure_stream(dynamo_table_name)
         print "Resolved DynamoDB Stream ARN: %s" % (dynamo_stream_arn)
 
         # now ensure that we have a firehose delivery stream that will route to the backup location
-        delivery_stream_arn = ensure_firehose_delivery_stream(dynamo_table_name)
+        delivery_stream_arn = ensure_firehose_delivery_stream(dynamo_table_name, delete_timeout)
         print "Resolved Firehose Delivery Stream ARN: %s" % (delivery_stream_arn)
 
         # wire the dynamo update stream to the deployed instance of lambda-streams-to-firehose
@@ -382,11 +712,13 @@ def configure_table(dynamo_table_name):
 
 
 '''
-Remove continuous backup via Update Streams, without affecting backup data on S3
+Remove continuous backup via Update Streams, without affecting backup data on S3. Returns the name of the Firehose
+Delivery Stream which is being deleted, if any
 '''
-def deprovision_table(dynamo_table_name):
+def deprovision_table(dynamo_table_name, event_source_mappings=None):
     # remote routing of update stream to lambda-streams-to-firehose
-    remove_stream_trigger(dynamo_table_name)
+    remove_stream_trigger(dynamo_table_name, event_source_mappings)
 
     # remove the firehose delivery stream
-    delete_fh_stream(dynamo_table_name)
+    return delete_fh_stream(dynamo_table_name)
+
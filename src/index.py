@@ -34,8 +34,9 @@ def event_handler(event, context):
             # resolve the table
             dynamo_table_name = event["detail"]["requestParameters"]["tableName"]
 
-            # configure the table for continuous backup
-            backup.configure_table(dynamo_table_name)
+            # configure the table for continuous backup. If a Delivery Stream of the same name is still being deleted
+            # when the function is about to time out then this raises, and the Lambda retry of the event completes it
+            backup.configure_table(dynamo_table_name, context)
         elif event['detail']['eventName'] == "DeleteTable":
             # delete the firehose delivery stream for this table
             dynamo_table_name = event["detail"]["requestParameters"]["tableName"]
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import dynamo_continuous_backup
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", dest='config_file', action='store', required=False, help="The HJSON configuration file used to build the backup module. Defaults to the compiled configuration")
+    parser.add_argument("--threshold", dest='threshold', action='store', type=float, default=dynamo_continuous_backup.DEFAULT_REBALANCE_THRESHOLD, help="Rebalance when a forwarder carries more than (1 + threshold) times the average expected write rate")
+    parser.add_argument("--dry-run", dest='dry_run', action='store_true', required=False, help="Report the moves without making them")
+    args = parser.parse_args()
+
+    dynamo_continuous_backup.init(args.config_file)
+
+    dynamo_continuous_backup.rebalance_forwarders(args.threshold, args.dry_run)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import sys
+
+# add the lib directory to the path
+sys.path.append('lib')
+
+import backup_restore
+import backup_store
+import argparse
+import calendar
+import datetime
+import hjson
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config-file", dest='config_file', action='store', required=False, help="The HJSON configuration file used to build the backup module")
+    parser.add_argument("--location", dest='location', action='store', required=False, help="s3://bucket/prefix or local directory holding the backup data. Defaults to the configured Firehose destination")
+    parser.add_argument("--target-table", dest='target_table', action='store', required=False, help="Table to restore items into. Defaults to the backed up table")
+    parser.add_argument("--hash-key-prefix", dest='hash_key_prefix', action='store', required=False, help="Restore items whose hash key value starts with this prefix")
+    parser.add_argument("--hash-key", dest='hash_key', action='store', required=False, help="Name of the hash key attribute. Defaults to the hash key of the target table")
+    parser.add_argument("--keys-file", dest='keys_file', action='store', required=False, help="HJSON file with a list of item Keys in DynamoDB JSON, as they appear in the backup data, to restore")
+    parser.add_argument("--until", dest='until', action='store', required=False, help="Restore items as they were at this UTC time (YYYY-MM-DDTHH:MM:SS), ignoring changes made after it")
+    parser.add_argument("--capacity-fraction", dest='capacity_fraction', action='store', type=float, default=backup_restore.DEFAULT_CAPACITY_FRACTION, help="Proportion of the target table's provisioned write capacity the restore may use")
+    parser.add_argument("--max-write-rate", dest='max_write_rate', action='store', type=float, default=backup_restore.DEFAULT_MAX_WRITE_RATE, help="Maximum write capacity units per second, which is the only limit for on demand tables")
+    parser.add_argument("--no-catalog", dest='no_catalog', action='store_true', required=False, help="List all backup objects rather than using the backup catalog")
+    parser.add_argument("--dry-run", dest='dry_run', action='store_true', required=False, help="Report what would be restored without writing to the target table")
+    parser.add_argument('table', help='Name of the backed up table')
+    args = parser.parse_args()
+
+    if args.hash_key_prefix == None and args.keys_file == None:
+        print "One of --hash-key-prefix or --keys-file must be supplied"
+        parser.print_help()
+        sys.exit(1)
+
+    config = None
+    if args.config_file != None:
+        config = hjson.load(open(args.config_file, 'r'))
+
+    if args.location != None:
+        location = args.location
+    elif config != None:
+        location = backup_store.location_from_config(config)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    delivery_interval = backup_restore.DEFAULT_DELIVERY_INTERVAL_SECONDS
+    if config != None and 'firehoseDeliveryIntervalSeconds' in config:
+        delivery_interval = int(config['firehoseDeliveryIntervalSeconds'])
+
+    backup_restore.init()
+
+    target_table = args.target_table if args.target_table != None else args.table
+
+    hash_key = args.hash_key
+    if args.hash_key_prefix != None and hash_key == None:
+        hash_key = backup_restore.get_hash_key_name(target_table)
+
+    keys = None
+    if args.keys_file != None:
+        keys = hjson.load(open(args.keys_file, 'r'))
+
+    until = None
+    if args.until != None:
+        until = calendar.timegm(datetime.datetime.strptime(args.until, '%Y-%m-%dT%H:%M:%S').utctimetuple())
+
+    predicate = backup_restore.key_predicate(hash_key, args.hash_key_prefix, keys)
+
+    backup_restore.restore(location, args.table, target_table, predicate, until, args.capacity_fraction, args.max_write_rate, args.dry_run, not args.no_catalog, delivery_interval)
@@ -12,8 +12,12 @@ import dynamo_continuous_backup
 import boto3
 import os
 import hjson
+import threading
+import time
+import Queue
 
 REGION_KEY = 'AWS_REGION'
+DEFAULT_DEPROVISION_THREADS = 10
 dynamo_client = None
 
 def init():
@@ -65,24 +69,96 @@ def provision_tables(table_list):
             print "Proceeding..."
 
 
-def deprovision_tables(table_list):
+'''
+Poll for the completion of Firehose Delivery Stream deletions on behalf of all deprovisioning workers, using a single
+listing of Delivery Streams per poll rather than one describe per stream. Runs until the workers are finished and all
+deletions are complete, or the remaining deletions have all exceeded the deletion timeout. Returns the Delivery Streams
+which are still being deleted
+'''
+def track_delivery_stream_deletions(deleting, lock, workers):
+    while True:
+        finished = len([x for x in workers if x.is_alive()]) == 0
+
+        with lock:
+            pending = set(deleting.keys())
+
+        if len(pending) > 0:
+            remaining = dynamo_continuous_backup.list_delivery_stream_names()
+
+            with lock:
+                for x in pending - remaining:
+                    print "Firehose Delivery Stream %s deleted after %.1f seconds" % (x, time.time() - deleting.pop(x))
+
+                still_deleting = deleting.keys()
+                timed_out = len([x for x in still_deleting if time.time() - deleting[x] > dynamo_continuous_backup.DELIVERY_STREAM_DELETE_TIMEOUT])
+
+            if finished and timed_out == len(still_deleting):
+                return still_deleting
+        elif finished:
+            return []
+
+        time.sleep(dynamo_continuous_backup.DELIVERY_STREAM_POLL_INTERVAL)
+
+
+def deprovision_tables(table_list, threads=DEFAULT_DEPROVISION_THREADS):
+    start_time = time.time()
+
+    # list the stream triggers once, rather than in every worker
+    event_source_mappings = dynamo_continuous_backup.list_stream_event_source_mappings()
+
+    work = Queue.Queue()
     for x in table_list:
-        try:
-            dynamo_continuous_backup.deprovision_table(x)
-        except Exception as e:
-            print "Exception while deprovisioning table %s" % (x)
-            print e
-            print "Proceeding..."
+        work.put(x)
+
+    lock = threading.Lock()
+    deleting = {}
+    failed = []
+
+    def deprovision_worker():
+        while True:
+            try:
+                x = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                delivery_stream_name = dynamo_continuous_backup.deprovision_table(x, event_source_mappings)
+
+                if delivery_stream_name != None:
+                    with lock:
+                        deleting[delivery_stream_name] = time.time()
+            except Exception as e:
+                print "Exception while deprovisioning table %s" % (x)
+                print e
+                print "Proceeding..."
+
+                with lock:
+                    failed.append(x)
+
+    workers = []
+    for i in range(max(1, min(threads, len(table_list)))):
+        worker = threading.Thread(target=deprovision_worker)
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    still_deleting = track_delivery_stream_deletions(deleting, lock, workers)
+
+    print "Deprovisioned %s tables in %.1f seconds" % (len(table_list) - len(failed), time.time() - start_time)
+    if len(failed) > 0:
+        print "Failed to deprovision %s tables: %s" % (len(failed), ", ".join(failed))
+    if len(still_deleting) > 0:
+        print "Firehose Delivery Streams still deleting after %s seconds: %s" % (dynamo_continuous_backup.DELIVERY_STREAM_DELETE_TIMEOUT, ", ".join(still_deleting))
 
    
-def deprovision(table_whitelist):
+def deprovision(table_whitelist, threads=DEFAULT_DEPROVISION_THREADS):
     init()
     
     table_list = resolve_table_list(table_whitelist)
     
     dynamo_continuous_backup.init(None)
         
-    deprovision_tables(table_list)
+    deprovision_tables(table_list, threads)
         
         
 def provision(table_whitelist):